@@ -3,11 +3,16 @@ import pandas as pd
 import yfinance as yf
 import matplotlib.pyplot as plt
 import math
-import requests
-import xml.etree.ElementTree as ET
+import numpy as np
 from datetime import datetime
 import os
-import re
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+import cache
+import dedupe
+import news
+import store
 
 # =================================================
 # CONFIG
@@ -15,10 +20,30 @@ import re
 st.set_page_config(page_title="Nifty 50 Advisory Dashboard", layout="wide")
 st.title("📊 Nifty 50 – Personal Investment Advisory")
 
-OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+FUNDAMENTALS_WORKERS = int(os.getenv("FUNDAMENTALS_WORKERS", "8"))
+FUNDAMENTALS_TIMEOUT = float(os.getenv("FUNDAMENTALS_TIMEOUT", "10"))
+HISTORY_REFRESH_SECS = int(os.getenv("HISTORY_REFRESH_SECS", "900"))
+HISTORY_PERIOD = "5y"      # stored/charted window
+VOLATILITY_PERIOD = "3y"   # window used for screener risk metrics
+BENCHMARK = "^NSEI"
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.065"))
+TRADING_DAYS = 252
+PREFETCH = os.getenv("PREFETCH", "1") == "1"
+METRICS_MAX_STALE = int(os.getenv("METRICS_MAX_STALE", str(6 * 3600)))
+METRICS_TTL = 3600
+TRANSIENT_TTL = 120          # retry transient provider failures soon...
+MISSING_TTL = 24 * 3600      # ...but don't keep asking about unknown symbols
+AI_STREAM = os.getenv("AI_STREAM", "0") == "1"     # default for the sidebar streaming toggle
+
 use_ai = st.sidebar.checkbox("🤖 Enable AI News Deep Dive", value=False)
+ai_ready = use_ai and (news.OPENAI_KEY or not news.ai.needs_key)
 
-if use_ai and not OPENAI_KEY:
+stream_ai = use_ai and st.sidebar.checkbox(
+    "Stream summaries as they are written", value=AI_STREAM,
+    help="One request per headline, shown token by token, instead of one batched request per stock."
+)
+
+if use_ai and not ai_ready:
     st.sidebar.warning("AI enabled but OpenAI key not found")
 
 # =================================================
@@ -46,132 +71,233 @@ if search:
 # =================================================
 # METRICS ENGINE
 # =================================================
-@st.cache_data(ttl=3600)
-def get_metrics(symbol):
+def period_start(period):
+    # "3y" -> ISO date three years back
+    start = pd.Timestamp.today().normalize() - pd.DateOffset(years=int(period.rstrip("y")))
+    return start.strftime("%Y-%m-%d")
+
+def download_history(symbols, **kwargs):
+    # Provider failures fall back to whatever the store already holds. Only
+    # symbols that came back with bars count as synced; those are returned.
     try:
-        t = yf.Ticker(symbol)
-        info = t.info
-        hist = t.history(period="3y")
-
-        price = info.get("currentPrice")
-        pe = info.get("trailingPE")
-        roe = info.get("returnOnEquity")
-
-        vol = None
-        if not hist.empty:
-            vol = hist["Close"].pct_change().std() * (252 ** 0.5) * 100
-
-        return price, pe, roe, vol
+        data = yf.download(list(symbols), progress=False, threads=True, **kwargs)
+        rows = store.to_long(data, list(symbols))
+        store.write_history(rows)
     except Exception:
-        return None, None, None, None
+        return set()
+
+    synced = set(rows["symbol"])
+    store.mark_synced(synced)
+    return synced
+
+def update_history(symbols, period=HISTORY_PERIOD):
+    # Bring the store up to date for `symbols`: unseen symbols get the full
+    # period, everything else only the bars from its last stored date onwards.
+    # The last bar itself is re-fetched as it may have been written mid-session.
+    symbols = list(symbols)
+    covered_from = (pd.Timestamp(period_start(period)) + pd.Timedelta(days=7)).strftime("%Y-%m-%d")
+
+    spans = store.date_spans(symbols)
+    fresh = store.synced_within(symbols, HISTORY_REFRESH_SECS)
+    # A full-period download is recorded, so short histories (recent
+    # listings, renamed tickers) only get delta fetches afterwards
+    backfilled = store.backfilled(symbols, period)
+    missing = [
+        s for s in symbols
+        if s not in fresh and (s not in spans or (spans[s][0] > covered_from and s not in backfilled))
+    ]
+
+    deltas = {}
+    for s in symbols:
+        if s not in missing and s not in fresh:
+            deltas.setdefault(spans[s][1], []).append(s)
+
+    if missing:
+        store.mark_backfilled(download_history(missing, period=period), period)
+    for since, group in deltas.items():
+        download_history(group, start=since)
+
+@cache.cached(ttl=HISTORY_REFRESH_SECS, max_stale=METRICS_MAX_STALE)
+def get_history(symbols):
+    # Single 5y close matrix shared by the screener metrics and the price chart.
+    # The benchmark index always rides along for beta.
+    symbols = list(symbols) + ([BENCHMARK] if BENCHMARK not in symbols else [])
+    update_history(symbols, HISTORY_PERIOD)
+    return store.read_closes(symbols, start=period_start(HISTORY_PERIOD))
+
+def compute_risk_metrics(closes, benchmark=BENCHMARK, risk_free=RISK_FREE_RATE):
+    # Whole date x symbol matrix in one pass -> one row of risk metrics per symbol
+    prices = closes.ffill()
+    returns = closes.pct_change(fill_method=None)
+
+    vol = returns.std() * np.sqrt(TRADING_DAYS)
+    mean_return = returns.mean() * TRADING_DAYS
+
+    year_ago = prices.iloc[-TRADING_DAYS - 1] if len(prices) > TRADING_DAYS else prices.bfill().iloc[0]
+    drawdown = (prices / prices.cummax() - 1).min()
+
+    if benchmark in returns:
+        beta = returns.cov()[benchmark] / returns[benchmark].var()
+    else:
+        beta = pd.Series(np.nan, index=closes.columns)
+
+    return pd.DataFrame({
+        "Price": prices.iloc[-1],
+        "Volatility %": vol * 100,
+        "1Y Return %": (prices.iloc[-1] / year_ago - 1) * 100,
+        "Max Drawdown %": drawdown * 100,
+        "Beta": beta,
+        "Sharpe": (mean_return - risk_free) / vol.replace(0, np.nan),
+    })
 
-# =================================================
-# GOOGLE NEWS (RSS)
-# =================================================
-@st.cache_data(ttl=900)
-def fetch_google_news(company):
-    query = f"{company} NSE stock"
-    url = (
-        "https://news.google.com/rss/search?q="
-        + requests.utils.quote(query)
-        + "&hl=en-IN&gl=IN&ceid=IN:en"
-    )
+def classify_error(e):
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    name = type(e).__name__
+
+    if status == 404 or isinstance(e, LookupError) or "NotFound" in name or "Delisted" in name:
+        return cache.MISSING
+    # Timeouts, connection resets, 429/5xx and anything unrecognised are
+    # treated as transient so they are retried rather than frozen.
+    return cache.TRANSIENT
+
+def _fetch_info(symbol):
+    info = yf.Ticker(symbol).info
+    if not info or not (info.get("quoteType") or info.get("symbol")):
+        raise LookupError(f"no quote data for {symbol}")
+    return info.get("trailingPE"), info.get("returnOnEquity")
+
+@cache.cached(ttl=METRICS_TTL, ttl_for=cache.negative_ttl(METRICS_TTL, TRANSIENT_TTL, MISSING_TTL))
+def get_fundamentals(symbol):
+    # Result((pe, roe)); failures are cached briefly (transient) or for a day (missing)
+    return cache.retry(lambda: _fetch_info(symbol), classify_error)
+
+def iter_fundamentals(symbols, max_workers=FUNDAMENTALS_WORKERS, timeout=FUNDAMENTALS_TIMEOUT):
+    # Yields (symbol, Result) as each lookup finishes. Every call gets
+    # `timeout` seconds of its worker wave; whatever is still running after
+    # that is reported as a transient timeout so one slow ticker cannot hold
+    # up the screener.
+    symbols = list(symbols)
+    if not symbols:
+        return
+
+    workers = max(1, min(max_workers, len(symbols)))
+    deadline = timeout * math.ceil(len(symbols) / workers)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(get_fundamentals, s): s for s in symbols}
+    pending = set(symbols)
+    try:
+        for f in as_completed(futures, timeout=deadline):
+            pending.discard(futures[f])
+            yield futures[f], f.result()
+    except FuturesTimeout:
+        for symbol in pending:
+            yield symbol, cache.Result(kind=cache.TRANSIENT, error="timeout")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+METRIC_COLUMNS = ["Price", "P/E", "ROE", "Volatility %", "1Y Return %",
+                  "Max Drawdown %", "Beta", "Sharpe"]
+
+def metrics_ttl(metrics):
+    # Re-assemble soon if any fundamentals failed transiently
+    failures = metrics.attrs.get("failures", {})
+    return TRANSIENT_TTL if cache.TRANSIENT in failures.values() else METRICS_TTL
+
+@cache.cached(ttl=METRICS_TTL, max_stale=METRICS_MAX_STALE, ttl_for=metrics_ttl)
+def get_metrics(symbols):
+    symbols = list(symbols)
+    metrics = pd.DataFrame(index=pd.Index(symbols, name="Symbol"),
+                           columns=METRIC_COLUMNS, dtype=float)
 
     try:
-        r = requests.get(url, timeout=10)
-        root = ET.fromstring(r.content)
-
-        items = []
-        for item in root.findall(".//item")[:5]:
-            title = item.findtext("title")
-            link = item.findtext("link")
-            if title and link:
-                items.append({"title": title, "link": link})
-        return items
+        closes = get_history(tuple(symbols)).loc[period_start(VOLATILITY_PERIOD):]
     except Exception:
-        return []
+        closes = pd.DataFrame()
+
+    if not closes.empty:
+        risk = compute_risk_metrics(closes).reindex(symbols)
+        metrics[risk.columns] = risk.to_numpy()
+
+    failures = {}
+    for symbol, result in iter_fundamentals(symbols):
+        if result.ok:
+            metrics.loc[symbol, ["P/E", "ROE"]] = result.value
+        else:
+            failures[symbol] = result.kind
+
+    metrics.attrs["failures"] = failures
+    return metrics
+
+def show_summary(slot, job):
+    with slot.container():
+        st.info(job["summary"])
+        if job.get("incomplete"):
+            st.caption("⚠️ Summary was cut off; it will be regenerated next time.")
+        usage = job.get("usage")
+        if usage:
+            st.caption(f"{usage['in']} tokens in · {usage['out']} tokens out")
 
 # =================================================
-# ARTICLE EXTRACTION (SAFE)
+# FRESHNESS
 # =================================================
-def extract_article_text(url):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(url, headers=headers, timeout=10)
-        text = re.sub("<[^<]+?>", "", r.text)
-        text = re.sub(r"\s+", " ", text)
-        return text[:4000]
-    except Exception:
-        return None
+def show_freshness(fn, *args):
+    age = fn.age(*args)
+    if age is None:
+        return
+    if fn.is_stale(*args):
+        st.caption(f"⏳ Showing data from {age / 60:.0f} min ago – refreshing in background")
+    else:
+        st.caption(f"Updated {age / 60:.0f} min ago")
 
 # =================================================
-# AI NEWS DEEP DIVE (SAFE)
+# BACKGROUND PREFETCH
 # =================================================
-def ai_news_deep_dive(company, headline, article_text):
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_KEY)
-
-        context = article_text if article_text else headline
-
-        prompt = f"""
-You are an equity research analyst.
+# Metrics and history are always computed for the whole universe so the
+# prefetcher and every filter combination share one warm cache entry.
+universe = tuple(stocks["Symbol"])
 
-Company: {company}
+@st.cache_resource
+def start_prefetcher():
+    jobs = [(get_history, (universe,)), (get_metrics, (universe,))]
+    jobs += [(news.ingest_news, (tuple(stocks["Company"]),))]
+    return cache.Prefetcher(jobs).start()
 
-News content:
-{context}
-
-Task:
-- Explain what happened
-- Why it matters (or not)
-- Risks or positives
-- NO buy/sell advice
-- NO price prediction
-
-Limit to 5 bullet points.
-"""
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=250
-        )
-
-        return response.choices[0].message.content.strip()
-
-    except Exception as e:
-        return "AI summary unavailable."
+if PREFETCH:
+    start_prefetcher()
 
 # =================================================
 # BUILD SCREENER
 # =================================================
-rows = []
-for _, r in filtered.iterrows():
-    price, pe, roe, vol = get_metrics(r["Symbol"])
-    rows.append({
-        "Company": r["Company"],
-        "Sector": r["Sector"],
-        "Price": price,
-        "P/E": pe,
-        "ROE": roe,
-        "Volatility %": vol
-    })
+metrics = get_metrics(universe)
 
-df = pd.DataFrame(rows)
+df = (
+    filtered[["Symbol", "Company", "Sector"]]
+    .join(metrics, on="Symbol")
+    .reset_index(drop=True)
+)
 
 st.subheader("📋 Nifty 50 Screener")
+show_freshness(get_metrics, universe)
 st.dataframe(df, use_container_width=True)
 
+failed = metrics.attrs.get("failures", {})
+if failed:
+    transient = sum(kind == cache.TRANSIENT for kind in failed.values())
+    st.caption(
+        f"Fundamentals unavailable for {len(failed)} symbol(s)"
+        + (f" – retrying {transient} shortly" if transient else "")
+    )
+
 # =================================================
 # STOCK DEEP DIVE
 # =================================================
 st.subheader("🔍 Stock Deep Dive")
 
-stock = st.selectbox("Select Stock", df["Company"])
-symbol = filtered[filtered["Company"] == stock]["Symbol"].values[0]
-price, pe, roe, vol = get_metrics(symbol)
+company_names = dict(zip(df["Symbol"], df["Company"]))
+symbol = st.selectbox("Select Stock", df["Symbol"], format_func=company_names.get)
+stock = company_names[symbol]
+price, pe, roe = metrics.loc[symbol, ["Price", "P/E", "ROE"]]
 
 c1, c2, c3 = st.columns(3)
 c1.metric("Price", price)
@@ -181,35 +307,138 @@ c3.metric("ROE", roe)
 # =================================================
 # PRICE CHART
 # =================================================
-hist = yf.download(symbol, period="5y", progress=False)
+hist = get_history(universe)[symbol].dropna()
 if not hist.empty:
     fig, ax = plt.subplots()
-    ax.plot(hist.index, hist["Close"])
+    ax.plot(hist.index, hist.values)
     ax.set_title("5Y Price Trend")
     st.pyplot(fig)
 
 # =================================================
 # NEWS DEEP DIVE
 # =================================================
+st.subheader("🗞️ Latest Across the Nifty 50")
+
+latest = news.latest_news()
+if not latest:
+    st.caption("News index is still warming up.")
+else:
+    for n in latest:
+        published = (
+            datetime.fromtimestamp(n["published"]).strftime("%d %b %H:%M")
+            if n["published"] else ""
+        )
+        st.markdown(f"**{n['company']}** · [{n['title']}]({n['link']}) {published}")
+
 st.subheader("📰 News Deep Dive")
 
-news_items = fetch_google_news(stock)
+# Written by digest.py; a plain store read, so it shows even with AI off
+overnight = store.latest_digest(stock)
+if overnight and overnight["items"]:
+    generated = datetime.fromtimestamp(overnight["created_at"]).strftime("%d %b %H:%M")
+    with st.expander(f"🌙 Overnight AI digest · generated {generated}", expanded=not ai_ready):
+        for d in overnight["items"]:
+            st.markdown(f"**[{d['title']}]({d['link']})**")
+            if d.get("also"):
+                st.caption("Also reported by: " + ", ".join(d["also"]))
+            st.info(d["summary"])
+
+news_items = news.fetch_google_news(stock)
+show_freshness(news.fetch_google_news, stock)
+
+# Syndicated copies of one story are collapsed so each is read and
+# summarised once
+clusters = dedupe.cluster_news(news_items)[:news.NEWS_PER_STOCK]
+news_items = [c[0] for c in clusters]
 
 if not news_items:
     st.info("No recent news found.")
 else:
-    for n in news_items:
+    placeholders = []
+    for n, members in zip(news_items, clusters):
         st.markdown(f"**{n['title']}**")
         st.markdown(f"[Read source]({n['link']})")
-
-        if use_ai and OPENAI_KEY:
-            with st.spinner("AI analyzing article..."):
-                article_text = extract_article_text(n["link"])
-                summary = ai_news_deep_dive(stock, n["title"], article_text)
-            st.info(summary)
-
+        others = [m.get("source") or "another outlet" for m in members[1:]]
+        if others:
+            st.caption("Also reported by: " + ", ".join(others))
+        placeholders.append(st.empty())
         st.markdown("---")
 
+    if ai_ready:
+        # All pipelines run at once; each summary lands in its own slot as
+        # soon as it is ready, so the wait is the slowest item, not the sum.
+        for slot in placeholders:
+            slot.caption("🤖 AI analyzing article...")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(news.NEWS_WORKERS, len(news_items)))) as pool:
+            if stream_ai:
+                # Workers push partial text onto a queue; only this thread
+                # touches the placeholders. Updates are coalesced per slot.
+                updates = queue.Queue()
+                futures = {
+                    pool.submit(news.stream_news_item, stock, n, lambda text, i=i: updates.put((i, text))): i
+                    for i, n in enumerate(news_items)
+                }
+                while True:
+                    finished = all(f.done() for f in futures)
+                    latest = {}
+                    try:
+                        i, text = updates.get(timeout=0.05)
+                        latest[i] = text
+                        while True:
+                            i, text = updates.get_nowait()
+                            latest[i] = text
+                    except queue.Empty:
+                        pass
+                    for i, text in latest.items():
+                        placeholders[i].markdown(text + " ▌")
+                    if finished and updates.empty():
+                        break
+
+                for f, i in futures.items():
+                    try:
+                        show_summary(placeholders[i], f.result())
+                    except Exception:
+                        placeholders[i].info(news.AI_UNAVAILABLE)
+            elif news.AI_BATCH:
+                # Downloads/cache lookups in parallel, then one LLM request
+                # for whatever is left
+                futures = {
+                    pool.submit(news.prepare_news_summary, stock, n, news.BATCH_PROMPT_VERSION): slot
+                    for n, slot in zip(news_items, placeholders)
+                }
+                jobs = []
+                for f in as_completed(futures):
+                    try:
+                        job = f.result()
+                    except Exception:
+                        futures[f].info(news.AI_UNAVAILABLE)
+                        continue
+                    job["slot"] = futures[f]
+                    if job["summary"] is not None:
+                        show_summary(job["slot"], job)
+                    jobs.append(job)
+
+                usage = {}
+                batch = news.summarize_news_batch(stock, [j for j in jobs if j["summary"] is None], usage)
+                for job in batch:
+                    show_summary(job["slot"], job)
+                if usage:
+                    st.caption(
+                        f"{len(batch)} headline(s) summarised in one request: "
+                        f"{usage['in']} tokens in · {usage['out']} tokens out"
+                    )
+            else:
+                futures = {
+                    pool.submit(news.summarize_news_item, stock, n): slot
+                    for n, slot in zip(news_items, placeholders)
+                }
+                for f in as_completed(futures):
+                    try:
+                        show_summary(futures[f], f.result())
+                    except Exception:
+                        futures[f].info(news.AI_UNAVAILABLE)
+
 # =================================================
 # PORTFOLIO ADVISORY (RESTORED)
 # =================================================
@@ -219,7 +448,7 @@ capital = st.number_input("Investment Capital (₹)", min_value=50000, step=1000
 risk = st.selectbox("Risk Profile", ["Low", "Moderate", "High"])
 
 if st.button("Generate Portfolio"):
-    eligible = df.dropna()
+    eligible = df.dropna(subset=["Price", "P/E", "ROE", "Volatility %"])
 
     if eligible.empty:
         st.warning("Insufficient data to generate portfolio.")
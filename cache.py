@@ -0,0 +1,269 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# =================================================
+# PROCESS-WIDE TTL CACHE
+# =================================================
+# Streamlit re-executes app.py on every rerun, so entries live here (module
+# state survives reruns) keyed by function name rather than on the wrapper.
+_entries = {}
+_locks = {}
+_inflight = set()
+_lrus = {}
+_registry_lock = threading.Lock()
+
+
+def key_lock(key):
+    with _registry_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+class CachedFunction:
+    # Stale-while-revalidate: past its TTL the last value is still returned
+    # immediately while one background refresh runs, for up to
+    # `max_stale - ttl` more seconds. Beyond that (or on a cold miss) the
+    # caller blocks. `ttl_for(value)` lets a function pick a TTL per result,
+    # e.g. short ones for transient failures. The grace is added to each
+    # entry's own TTL, so without `max_stale` an expired entry is recomputed
+    # in the caller's thread (and worker pool), never in a thread of its own.
+    def __init__(self, fn, ttl, max_stale=None, ttl_for=None):
+        self.fn = fn
+        self.ttl = ttl
+        self.grace = 0 if max_stale is None else max(0, max_stale - ttl)
+        self.ttl_for = ttl_for
+        self.name = f"{fn.__module__}.{fn.__qualname__}"
+        self.__name__ = fn.__name__
+        self.__doc__ = fn.__doc__
+
+    def _key(self, args):
+        return (self.name, args)
+
+    def __call__(self, *args):
+        entry = _entries.get(self._key(args))
+        if entry is not None:
+            value, fetched_at, ttl = entry
+            age = time.time() - fetched_at
+            if age < ttl:
+                return value
+            if age < ttl + self.grace:
+                self.revalidate(*args)
+                return value
+        return self._compute(args, seen=entry)
+
+    def refresh(self, *args):
+        # Force a recompute even if the current entry is still fresh
+        return self._compute(args, seen=_entries.get(self._key(args)))
+
+    def revalidate(self, *args):
+        # Fire-and-forget refresh; at most one in flight per key
+        key = self._key(args)
+        with _registry_lock:
+            if key in _inflight:
+                return
+            _inflight.add(key)
+
+        def run():
+            try:
+                self.refresh(*args)
+            except Exception:
+                pass
+            finally:
+                with _registry_lock:
+                    _inflight.discard(key)
+
+        threading.Thread(target=run, name=f"revalidate:{self.__name__}", daemon=True).start()
+
+    def _compute(self, args, seen):
+        # Swap the new value in atomically; concurrent callers for the same
+        # key wait for the one computation instead of starting their own.
+        key = self._key(args)
+        with key_lock(key):
+            entry = _entries.get(key)
+            if entry is not seen and entry is not None:
+                return entry[0]
+
+            value = self.fn(*args)
+            ttl = self.ttl if self.ttl_for is None else self.ttl_for(value)
+            _entries[key] = (value, time.time(), ttl)
+            return value
+
+    def age(self, *args):
+        entry = _entries.get(self._key(args))
+        return None if entry is None else time.time() - entry[1]
+
+    def entry_ttl(self, *args):
+        entry = _entries.get(self._key(args))
+        return self.ttl if entry is None else entry[2]
+
+    def is_stale(self, *args):
+        age = self.age(*args)
+        return age is not None and age >= self.entry_ttl(*args)
+
+    def clear(self):
+        for key in [k for k in _entries if k[0] == self.name]:
+            _entries.pop(key, None)
+
+
+def cached(ttl, max_stale=None, ttl_for=None):
+    return lambda fn: CachedFunction(fn, ttl, max_stale, ttl_for)
+
+
+# =================================================
+# SINGLE-FLIGHT
+# =================================================
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_flights = {}
+
+
+def coalesce(key, fn):
+    # Concurrent callers with the same key share one fn() call. Returns
+    # (value, shared) where shared is True for callers that only waited.
+    with _registry_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, True
+
+    try:
+        flight.value = fn()
+        return flight.value, False
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _registry_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# =================================================
+# BOUNDED LRU
+# =================================================
+class LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def lru(name, maxsize):
+    # Named LRU that survives Streamlit reruns
+    with _registry_lock:
+        if name not in _lrus:
+            _lrus[name] = LRU(maxsize)
+        return _lrus[name]
+
+
+# =================================================
+# FETCH RESULTS, NEGATIVE CACHING & RETRY
+# =================================================
+OK = "ok"
+TRANSIENT = "transient"   # timeouts, rate limits, 5xx: retry soon
+MISSING = "missing"       # delisted / unknown symbol: don't ask again for a while
+
+
+@dataclass
+class Result:
+    value: object = None
+    kind: str = OK
+    error: str = None
+    attempts: int = 1
+
+    @property
+    def ok(self):
+        return self.kind == OK
+
+
+def negative_ttl(ok, transient, missing):
+    # ttl_for callback for functions returning Result
+    ttls = {OK: ok, TRANSIENT: transient, MISSING: missing}
+    return lambda result: ttls.get(result.kind, transient)
+
+
+def retry(fn, classify, attempts=3, backoff=0.5):
+    # Runs fn() and wraps the outcome in a Result. Transient failures are
+    # retried with jittered exponential backoff; anything else returns at once.
+    for attempt in range(1, attempts + 1):
+        try:
+            return Result(fn(), OK, attempts=attempt)
+        except Exception as e:
+            kind = classify(e)
+            if kind != TRANSIENT or attempt == attempts:
+                return Result(None, kind, f"{type(e).__name__}: {e}", attempt)
+            time.sleep(backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+
+
+# =================================================
+# BACKGROUND PREFETCH
+# =================================================
+class Prefetcher:
+    # Keeps a fixed set of (cached_fn, args) jobs warm by refreshing each one
+    # once it is `ahead` of the way through its TTL, before users see a miss.
+    def __init__(self, jobs, ahead=0.8, poll=30):
+        self.jobs = list(jobs)
+        self.ahead = ahead
+        self.poll = poll
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self):
+        due = []
+        for fn, args in self.jobs:
+            age = fn.age(*args)
+            if age is None or age >= fn.entry_ttl(*args) * self.ahead:
+                due.append((fn, args))
+        return due
+
+    def run_once(self):
+        for fn, args in self.due():
+            if self._stop.is_set():
+                return
+            try:
+                fn.refresh(*args)
+            except Exception as e:
+                self.last_error = e
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.poll)
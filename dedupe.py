@@ -0,0 +1,73 @@
+import hashlib
+import random
+import re
+
+# =================================================
+# NEAR-DUPLICATE DETECTION (SHINGLING + MINHASH)
+# =================================================
+NUM_PERM = 64
+_PRIME = (1 << 61) - 1
+_rng = random.Random(50)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "at", "by",
+    "with", "from", "as", "is", "are", "was", "its", "it", "this", "that",
+    "after", "over", "amid", "says", "said", "stock", "share", "shares", "nse", "bse",
+}
+
+
+def strip_source(title, source=None):
+    # Google News titles end in " - Publisher"
+    if source and title.endswith(f" - {source}"):
+        return title[: -len(source) - 3]
+    head, sep, _ = title.rpartition(" - ")
+    return head if sep and len(head) > 20 else title
+
+
+def shingles(text, words=True):
+    # Titles: content words plus word bigrams. Body text: 5-char shingles.
+    text = re.sub(r"[^a-z0-9 ]+", " ", text.lower())
+    if not words:
+        text = re.sub(r"\s+", " ", text).strip()
+        return {text[i:i + 5] for i in range(max(1, len(text) - 4))}
+
+    tokens = [t for t in text.split() if t not in STOPWORDS]
+    return set(tokens) | {" ".join(p) for p in zip(tokens, tokens[1:])}
+
+
+def signature(shingle_set):
+    if not shingle_set:
+        return None
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingle_set
+    ]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def similarity(sig_a, sig_b):
+    # MinHash estimate of Jaccard similarity
+    if sig_a is None or sig_b is None:
+        return 0.0
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def cluster(items, text_of, threshold=0.4, words=True):
+    # Greedy single pass: each item joins the first cluster whose lead it
+    # resembles, else starts a new one. Order (and so each lead) is preserved.
+    clusters = []
+    for item in items:
+        sig = signature(shingles(text_of(item), words))
+        for c in clusters:
+            if similarity(sig, c["signature"]) >= threshold:
+                c["items"].append(item)
+                break
+        else:
+            clusters.append({"signature": sig, "items": [item]})
+    return [c["items"] for c in clusters]
+
+
+def cluster_news(items, threshold=0.4):
+    # [[lead, *duplicates], ...] by headline, ignoring the publisher suffix
+    return cluster(items, lambda n: strip_source(n["title"], n.get("source")), threshold)
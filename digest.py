@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import pandas as pd
+
+import news
+import store
+
+# =================================================
+# NIGHTLY AI NEWS DIGEST
+# =================================================
+# Pre-summarises the top headlines of every company in the universe so the
+# dashboard can show them straight from the store. Progress is saved per
+# company, so re-running the same --run after an interruption only does
+# what is left.
+#
+#   python digest.py                      # today's run, resuming if started
+#   python digest.py --run 2026-10-18 --force
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "4"))   # companies in flight at once
+
+
+def digest_company(company, symbol, headlines):
+    items = news.fetch_google_news(company)
+    if not items:
+        # fetch_google_news returns [] on network errors as well
+        raise RuntimeError("no headlines fetched")
+
+    summaries = news.summarize_headlines(company, items, limit=headlines)
+    if not any(is_summarised(d) for d in summaries):
+        raise RuntimeError("no summary available")
+    return company, symbol, summaries
+
+
+def is_summarised(item):
+    return item["summary"] != news.AI_UNAVAILABLE
+
+
+def pending_companies(stocks, run, force=False):
+    # A company counts as done only once every stored headline has a summary.
+    # Partial ones are redone; headlines that were summarised come straight
+    # back from the summary cache, so only the unavailable ones hit the LLM.
+    written = {} if force else store.digest_items(run)
+    done = {c for c, items in written.items() if items and all(map(is_summarised, items))}
+    todo = [(c, s) for s, c in zip(stocks["Symbol"], stocks["Company"]) if c not in done]
+    return done, todo
+
+
+def run_digest(universe, run, workers=DIGEST_WORKERS, headlines=news.NEWS_PER_STOCK, force=False):
+    stocks = pd.read_csv(universe)
+    done, todo = pending_companies(stocks, run, force)
+    print(f"digest {run}: {len(done)} done, {len(todo)} to go", file=sys.stderr)
+
+    failed = 0
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(digest_company, c, s, headlines): c for c, s in todo}
+        for n, f in enumerate(as_completed(futures), 1):
+            company = futures[f]
+            try:
+                company, symbol, summaries = f.result()
+            except Exception as e:
+                # Nothing is written, so the next run with this id retries it
+                failed += 1
+                print(f"[{n}/{len(todo)}] {company}: failed ({type(e).__name__}: {e})", file=sys.stderr)
+                continue
+
+            store.put_digest(run, company, symbol, summaries)
+            missing = sum(not is_summarised(d) for d in summaries)
+            if missing:
+                # Kept so the dashboard has something, but left pending for resume
+                failed += 1
+                print(f"[{n}/{len(todo)}] {company}: {missing}/{len(summaries)} summaries unavailable", file=sys.stderr)
+            else:
+                print(f"[{n}/{len(todo)}] {company}: {len(summaries)} headline(s)", file=sys.stderr)
+
+    print(f"digest {run}: finished in {time.time() - started:.0f}s, {failed} failed", file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute AI news summaries for the whole universe.")
+    parser.add_argument("--universe", default="nifty50.csv", help="CSV with Symbol and Company columns")
+    parser.add_argument("--run", default=date.today().isoformat(), help="run id; re-use it to resume")
+    parser.add_argument("--workers", type=int, default=DIGEST_WORKERS, help="companies processed concurrently")
+    parser.add_argument("--headlines", type=int, default=news.NEWS_PER_STOCK, help="stories summarised per company")
+    parser.add_argument("--force", action="store_true", help="redo companies already in this run")
+    args = parser.parse_args(argv)
+
+    if news.ai.needs_key and not news.OPENAI_KEY:
+        parser.error("OPENAI_API_KEY is not set (or pick another SUMMARIZER_BACKEND)")
+
+    failed = run_digest(args.universe, args.run, args.workers, args.headlines, args.force)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import os
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# =================================================
+# SHARED HTTP SESSION
+# =================================================
+# One keep-alive pool for every outbound request the app makes. Sessions are
+# shared across worker threads for plain GETs (urllib3's pool is thread-safe);
+# nothing here mutates session state after it is built.
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+USER_AGENT = "Mozilla/5.0"
+
+_session = None
+_lock = threading.Lock()
+_host_slots = {}
+
+
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+                # urllib3 sleeps out Retry-After uncapped (hours, for some
+                # 429s) while holding the caller and its host slot
+                respect_retry_after_header=False,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retry,
+            )
+            s = requests.Session()
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers["User-Agent"] = USER_AGENT
+            _session = s
+        return _session
+
+
+def _host_slot(url):
+    # Caps concurrent requests per host so bulk jobs don't hammer one site
+    host = urlsplit(url).netloc.lower()
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HTTP_PER_HOST)
+        return _host_slots[host]
+
+
+# =================================================
+# REQUESTS
+# =================================================
+@contextmanager
+def stream(url, timeout=HTTP_TIMEOUT, **kwargs):
+    # Streaming GET; the host slot is held until the body has been consumed
+    with _host_slot(url):
+        with session().get(url, timeout=timeout, stream=True, **kwargs) as r:
+            yield r
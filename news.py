@@ -0,0 +1,502 @@
+import codecs
+import hashlib
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+import cache
+import dedupe
+import net
+import store
+import summarizer
+
+# =================================================
+# CONFIG
+# =================================================
+# News, article and AI summary pipeline shared by the dashboard (app.py)
+# and the offline digest job (digest.py); nothing here touches Streamlit.
+OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+NEWS_MAX_STALE = int(os.getenv("NEWS_MAX_STALE", "3600"))
+NEWS_WORKERS = int(os.getenv("NEWS_WORKERS", "5"))
+NEWS_TTL = 900
+NEWS_PER_STOCK = 5            # story clusters shown per stock
+TEXT_DUPLICATE_THRESHOLD = 0.8
+NEWS_FEED_ITEMS = 20          # items kept per company in the news index
+NEWS_INGEST_WORKERS = int(os.getenv("NEWS_INGEST_WORKERS", "8"))
+AI_MODEL = os.getenv("AI_MODEL", "gpt-4o-mini")
+# openai | local (llama.cpp / any OpenAI-compatible server) | extractive | stub
+AI_BACKEND = os.getenv("SUMMARIZER_BACKEND", "stub" if AI_MODEL == "stub" else "openai")
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1")
+AI_BATCH = os.getenv("AI_BATCH", "1") == "1"       # one request per stock instead of per headline
+PROMPT_VERSION = "v2"        # bump when the prompt changes to invalidate cached summaries
+BATCH_PROMPT_VERSION = "batch-v2"
+AI_CONTEXT_TOKENS = int(os.getenv("AI_CONTEXT_TOKENS", "600"))   # article budget per summary
+AI_UNAVAILABLE = "AI summary unavailable."
+ARTICLE_TTL = int(os.getenv("ARTICLE_TTL", str(6 * 3600)))
+ARTICLE_MEMORY_SIZE = int(os.getenv("ARTICLE_MEMORY_SIZE", "256"))
+ARTICLE_CHARS = 4000                 # visible text kept per article
+ARTICLE_MAX_BYTES = 2 * 1024 * 1024  # stop reading a page after this much
+ai = summarizer.get_summarizer(AI_BACKEND, model=AI_MODEL, api_key=OPENAI_KEY, base_url=LOCAL_LLM_URL)
+
+# =================================================
+# GOOGLE NEWS (RSS)
+# =================================================
+def news_feed_url(company):
+    query = f"{company} NSE stock"
+    return (
+        "https://news.google.com/rss/search?q="
+        + requests.utils.quote(query)
+        + "&hl=en-IN&gl=IN&ceid=IN:en"
+    )
+
+def parse_pubdate(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except Exception:
+        return None
+
+def iter_news_feed(source, limit=NEWS_FEED_ITEMS, known=()):
+    # Streams <item>s out of an RSS file-like as they are parsed, stopping
+    # after `limit` items so the rest of the feed is neither parsed nor, when
+    # streaming, downloaded. Links in `known` (already indexed) count towards
+    # the limit but aren't yielded. Search feeds are ranked by relevance, not
+    # date, so there is no "seen this one, the rest is older" cut-off.
+    count = 0
+    for _, elem in ET.iterparse(source, events=("end",)):
+        if elem.tag != "item":
+            continue
+
+        title = elem.findtext("title")
+        link = elem.findtext("link")
+        if title and link and link not in known:
+            yield {
+                "title": title,
+                "link": link,
+                "source": elem.findtext("source"),
+                "published": parse_pubdate(elem.findtext("pubDate")),
+            }
+        if title and link:
+            count += 1
+        elem.clear()
+        if count >= limit:
+            return
+
+def fetch_news_feed(company, known=()):
+    with net.stream(news_feed_url(company)) as r:
+        r.raw.decode_content = True
+        return list(iter_news_feed(r.raw, known=known))
+
+@cache.cached(ttl=NEWS_TTL, max_stale=NEWS_MAX_STALE)
+def ingest_news(companies):
+    # Pull every company's feed concurrently over the shared keep-alive pool
+    # and write the items into the local news index. Returns items indexed.
+    companies = list(companies)
+    workers = max(1, min(NEWS_INGEST_WORKERS, len(companies)))
+    indexed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Refreshes only write items whose links aren't indexed yet
+        futures = {pool.submit(fetch_news_feed, c, store.known_links(c)): c for c in companies}
+        for f in as_completed(futures):
+            try:
+                items = f.result()
+            except Exception:
+                continue
+            store.put_news(futures[f], items)
+            indexed += len(items)
+    return indexed
+
+@cache.cached(ttl=NEWS_TTL, max_stale=NEWS_MAX_STALE)
+def fetch_google_news(company):
+    # Served from the news index when the ingester has it, live otherwise.
+    # Returns the full recent list; the panel collapses syndicated duplicates.
+    items = store.company_news(company, NEWS_FEED_ITEMS, fresh_within=NEWS_MAX_STALE)
+    if items:
+        return items
+
+    try:
+        items = fetch_news_feed(company)
+    except Exception:
+        return []
+    store.put_news(company, items)
+    return items
+
+@cache.cached(ttl=60)
+def latest_news(limit=20):
+    return store.latest_news(limit)
+
+# =================================================
+# ARTICLE EXTRACTION (SAFE)
+# =================================================
+TRACKING_PARAMS = {"oc", "fbclid", "gclid", "ref", "ref_src", "cmpid", "ito"}
+
+def canonical_url(url):
+    # Same article, same key: lower-case host, no fragment, no tracking
+    # params, sorted query. Google News /rss/articles/<id> and
+    # /articles/<id> links point at the same story.
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    path = parts.path or "/"
+    if host == "news.google.com" and path.startswith("/rss/articles/"):
+        path = path[len("/rss"):]
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((parts.scheme.lower() or "https", host, path, urlencode(query), ""))
+
+class ArticleExtractor(HTMLParser):
+    # Incremental HTML -> article text. Script/style/nav-type elements are
+    # skipped outright, text is collected per block, and text() prefers the
+    # <article>/<main> block, falling back to <p> paragraphs, then anything.
+    # `done` flips once the preferred block holds enough text, which lets the
+    # caller stop downloading.
+    SKIP = {"script", "style", "noscript", "template", "svg", "iframe", "nav",
+            "header", "footer", "aside", "form", "button", "select", "figure"}
+    MAIN = {"article", "main"}
+    BLOCKS = {"p", "div", "section", "li", "ul", "ol", "br", "blockquote", "pre",
+              "h1", "h2", "h3", "h4", "h5", "h6", "td", "tr", "table"}
+    MIN_PARAGRAPH = 25   # shorter paragraphs are usually captions / share links
+    MIN_MAIN = 200       # an <article> with less text than this is probably a teaser
+
+    def __init__(self, limit=ARTICLE_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self._skip = []
+        self._main = 0
+        self._para = 0
+        self._buf = []
+        self.blocks = {"main": [], "para": [], "other": []}
+        self.sizes = {"main": 0, "para": 0, "other": 0}
+
+    @property
+    def done(self):
+        preferred = "main" if self.sizes["main"] >= self.MIN_MAIN else "para"
+        return self.sizes[preferred] >= self.limit
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip.append(tag)
+            return
+        if self._skip:
+            return
+        if tag in self.BLOCKS or tag in self.MAIN:
+            self._flush()
+        if tag in self.MAIN:
+            self._main += 1
+        elif tag == "p":
+            self._para += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            # Tolerate sloppy nesting: close back to the matching element
+            if tag in self._skip:
+                while self._skip and self._skip.pop() != tag:
+                    pass
+            return
+        if self._skip:
+            return
+        if tag in self.BLOCKS or tag in self.MAIN:
+            self._flush()
+        if tag in self.MAIN:
+            self._main = max(0, self._main - 1)
+        elif tag == "p":
+            self._para = max(0, self._para - 1)
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._buf.append(data)
+
+    def _flush(self):
+        text = re.sub(r"\s+", " ", "".join(self._buf)).strip()
+        self._buf = []
+        if not text:
+            return
+        if self._main:
+            kind = "main"
+        elif self._para and len(text) >= self.MIN_PARAGRAPH:
+            kind = "para"
+        else:
+            kind = "other"
+        self.blocks[kind].append(text)
+        self.sizes[kind] += len(text)
+
+    def text(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+        self._flush()
+
+        if self.sizes["main"] >= self.MIN_MAIN:
+            blocks = self.blocks["main"]
+        elif self.blocks["para"]:
+            blocks = self.blocks["para"]
+        else:
+            blocks = self.blocks["other"]
+        return "\n".join(blocks)[:self.limit]
+
+def read_visible_text(response, extractor):
+    # Decode and strip the body as it streams in; stop at the text budget or
+    # the byte cap, whichever comes first.
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    read = 0
+    for chunk in response.iter_content(chunk_size=16384):
+        read += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or read >= ARTICLE_MAX_BYTES:
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+    return extractor.text()
+
+def extract_article_text(url):
+    # Memory LRU -> on-disk store -> network. Past ARTICLE_TTL the stored copy
+    # is revalidated with ETag / Last-Modified instead of re-downloaded, and
+    # concurrent requests for one URL share a single download. Only 200s are
+    # cached; error pages fall back to the last good copy, if any.
+    url = canonical_url(url)
+    memory = cache.lru("articles", ARTICLE_MEMORY_SIZE)
+    text = _fresh_article(memory.get(url))
+    if text is not None:
+        return text
+
+    # Single-flight rather than a per-URL lock, which would never be freed
+    text, _ = cache.coalesce(("article", url), lambda: _load_article(url, memory))
+    return text
+
+def _load_article(url, memory):
+    stored = store.get_article(url)
+    if stored and time.time() - stored["fetched_at"] < ARTICLE_TTL:
+        memory.put(url, (stored["text"], stored["fetched_at"]))
+        return stored["text"]
+
+    headers = {}
+    if stored and stored["etag"]:
+        headers["If-None-Match"] = stored["etag"]
+    if stored and stored["last_modified"]:
+        headers["If-Modified-Since"] = stored["last_modified"]
+
+    try:
+        with net.stream(url, headers=headers) as r:
+            if r.status_code == 304 and stored:
+                store.touch_article(url)
+                text = stored["text"]
+            elif r.status_code == 200:
+                text = read_visible_text(r, ArticleExtractor())
+                store.put_article(
+                    {url, canonical_url(r.url)}, text,
+                    r.headers.get("ETag"), r.headers.get("Last-Modified"),
+                )
+            else:
+                return stored["text"] if stored else None
+    except Exception:
+        return stored["text"] if stored else None
+
+    memory.put(url, (text, time.time()))
+    return text
+
+def _fresh_article(entry):
+    # Memory entries are (text, fetched_at) and expire like the store's
+    if entry is None or time.time() - entry[1] >= ARTICLE_TTL:
+        return None
+    return entry[0]
+
+# =================================================
+# AI NEWS DEEP DIVE (SAFE)
+# =================================================
+def ai_news_deep_dive(company, headline, article_text, usage=None):
+    try:
+        return ai.summarize(company, headline, article_text, AI_CONTEXT_TOKENS, usage=usage)
+
+    except Exception:
+        return AI_UNAVAILABLE
+
+class StreamInterrupted(Exception):
+    # A stream that failed after producing some text; `text` is what arrived
+    def __init__(self, text):
+        super().__init__("summary stream interrupted")
+        self.text = text
+
+def ai_news_deep_dive_stream(company, headline, article_text, usage=None):
+    # Yields the summary text accumulated so far as tokens arrive. A failure
+    # before the first token yields AI_UNAVAILABLE; after it, raises
+    # StreamInterrupted so the partial text is never taken as finished.
+    text = ""
+    try:
+        for delta in ai.summarize_stream(company, headline, article_text, AI_CONTEXT_TOKENS, usage=usage):
+            text += delta
+            yield text
+    except Exception:
+        if text:
+            raise StreamInterrupted(text)
+        yield AI_UNAVAILABLE
+
+def summary_key(*parts):
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def prepare_news_summary(company, item, version=PROMPT_VERSION):
+    # Resolves a headline against the summary cache, downloading the article
+    # only if needed. Returns a job dict; job["summary"] is None when the LLM
+    # still has to be asked. Summaries are cached by content hash, plus an
+    # alias on the link so a repeat view skips the download as well.
+    job = {"item": item, "summary": None, "article_text": None, "usage": None}
+    link_key = summary_key(company, "link", item["link"], version, ai.id)
+    job["summary"] = store.get_summary(link_key)
+    if job["summary"] is not None:
+        return job
+
+    job["article_text"] = extract_article_text(item["link"])
+    job["context"] = job["article_text"] or item["title"]
+    content_key = summary_key(company, "text", job["context"], version, ai.id)
+    job["keys"] = [content_key, link_key]
+
+    cached = store.get_summary(content_key)
+    if cached is None:
+        cached = find_duplicate_summary(company, job["context"])
+    if cached is not None:
+        store.put_summary(job["keys"], cached)
+        job["summary"] = cached
+    return job
+
+def save_news_summary(company, job, summary):
+    job["summary"] = summary
+    if summary != AI_UNAVAILABLE:
+        store.put_summary(job["keys"], summary)
+        remember_article(company, job["context"], job["keys"][0])
+
+# Sessions looking at the same stock ask for the same summaries; keying the
+# LLM call on the content hash means concurrent identical requests share one
+# in-flight call (cache.coalesce) instead of each paying for it.
+def summarize_news_item(company, item):
+    # One extract -> summarize pipeline; run per headline in a worker thread
+    job = prepare_news_summary(company, item)
+    if job["summary"] is None:
+        def call():
+            usage = {}
+            return ai_news_deep_dive(company, item["title"], job["article_text"], usage=usage), usage
+
+        (summary, usage), shared = cache.coalesce(("summary", job["keys"][0]), call)
+        job["usage"] = None if shared else usage
+        save_news_summary(company, job, summary)
+    return job
+
+def stream_news_item(company, item, emit):
+    # Like summarize_news_item, but calls emit(partial_text) as the summary
+    # is generated. Runs in a worker thread, so emit must not touch the UI.
+    # Callers coalesced onto someone else's stream get the finished text.
+    # An interrupted stream is shown as far as it got (job["incomplete"])
+    # but not cached.
+    job = prepare_news_summary(company, item)
+    if job["summary"] is None:
+        def call():
+            usage, summary = {}, AI_UNAVAILABLE
+            try:
+                for summary in ai_news_deep_dive_stream(company, item["title"], job["article_text"], usage):
+                    emit(summary)
+            except StreamInterrupted as e:
+                return e.text.strip(), usage, False
+            return summary.strip() or AI_UNAVAILABLE, usage, True
+
+        (summary, usage, complete), shared = cache.coalesce(("summary", job["keys"][0]), call)
+        if shared:
+            emit(summary)
+        job["usage"] = None if shared else usage
+        if complete:
+            save_news_summary(company, job, summary)
+        else:
+            job["summary"], job["incomplete"] = summary, True
+    return job
+
+def summarize_news_batch(company, jobs, usage=None):
+    # All still-unsummarised headlines of a stock go out in one request
+    pending = sorted((j for j in jobs if j["summary"] is None), key=lambda j: j["keys"][0])
+    if not pending:
+        return jobs
+
+    def call():
+        batch_usage = {}
+        try:
+            summaries = ai.summarize_batch(
+                company,
+                [(j["item"]["title"], j["article_text"] or j["context"]) for j in pending],
+                budget=AI_CONTEXT_TOKENS,
+                usage=batch_usage,
+            )
+        except Exception:
+            summaries = [None] * len(pending)
+        return summaries, batch_usage
+
+    key = ("batch",) + tuple(j["keys"][0] for j in pending)
+    (summaries, batch_usage), shared = cache.coalesce(key, call)
+    if usage is not None and not shared:
+        usage.update(batch_usage)
+
+    for job, summary in zip(pending, summaries):
+        save_news_summary(company, job, summary or AI_UNAVAILABLE)
+    return jobs
+
+def _text_signature(context):
+    return dedupe.signature(dedupe.shingles(context[:1500], words=False))
+
+def find_duplicate_summary(company, context):
+    # Syndicated copies that slipped past headline clustering (different
+    # titles, same body) reuse the summary of the article they duplicate
+    sig = _text_signature(context)
+    for other, key in cache.lru("article_signatures", 256).get(company, []):
+        if dedupe.similarity(sig, other) >= TEXT_DUPLICATE_THRESHOLD:
+            summary = store.get_summary(key)
+            if summary is not None:
+                return summary
+    return None
+
+def remember_article(company, context, key):
+    seen = cache.lru("article_signatures", 256)
+    seen.put(company, (seen.get(company, []) + [(_text_signature(context), key)])[-20:])
+
+# =================================================
+# HEADLINE DIGEST (OFFLINE)
+# =================================================
+def summarize_headlines(company, items, limit=NEWS_PER_STOCK, workers=NEWS_WORKERS):
+    # Same pipeline as the dashboard panel, without the UI: collapse
+    # syndicated copies, then summarise the top `limit` stories, batched
+    # into one request when AI_BATCH is on. Returns plain dicts for storage.
+    clusters = dedupe.cluster_news(items)[:limit]
+    if not clusters:
+        return []
+
+    leads = [c[0] for c in clusters]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(leads)))) as pool:
+        if AI_BATCH:
+            jobs = list(pool.map(
+                lambda n: _safe_job(prepare_news_summary, company, n, BATCH_PROMPT_VERSION), leads
+            ))
+            summarize_news_batch(company, [j for j in jobs if j["summary"] is None])
+        else:
+            jobs = list(pool.map(lambda n: _safe_job(summarize_news_item, company, n), leads))
+
+    return [
+        {
+            "title": j["item"]["title"],
+            "link": j["item"]["link"],
+            "source": j["item"].get("source"),
+            "also": [m.get("source") for m in members[1:] if m.get("source")],
+            "summary": j["summary"] or AI_UNAVAILABLE,
+        }
+        for j, members in zip(jobs, clusters)
+    ]
+
+def _safe_job(fn, company, item, *args):
+    # A failed download/lookup still yields a row, marked unavailable
+    try:
+        return fn(company, item, *args)
+    except Exception:
+        return {"item": item, "summary": AI_UNAVAILABLE}
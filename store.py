@@ -0,0 +1,387 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+# =================================================
+# LOCAL MARKET DATA STORE (SQLite)
+# =================================================
+DB_PATH = os.getenv("MARKET_DB", os.path.join(".cache", "market.db"))
+SUMMARY_CACHE_MAX = int(os.getenv("SUMMARY_CACHE_MAX", "5000"))
+SUMMARY_CACHE_DAYS = int(os.getenv("SUMMARY_CACHE_DAYS", "30"))
+ARTICLE_CACHE_DAYS = int(os.getenv("ARTICLE_CACHE_DAYS", "7"))
+NEWS_KEEP_DAYS = int(os.getenv("NEWS_KEEP_DAYS", "14"))
+DIGEST_KEEP_RUNS = int(os.getenv("DIGEST_KEEP_RUNS", "7"))
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+COLUMNS = ["symbol", "date"] + [f.lower() for f in FIELDS]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ohlcv (
+    symbol TEXT NOT NULL,
+    date   TEXT NOT NULL,
+    open   REAL,
+    high   REAL,
+    low    REAL,
+    close  REAL,
+    volume REAL,
+    PRIMARY KEY (symbol, date)
+);
+CREATE TABLE IF NOT EXISTS sync (
+    symbol    TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backfills (
+    symbol        TEXT NOT NULL,
+    period        TEXT NOT NULL,
+    backfilled_at REAL NOT NULL,
+    PRIMARY KEY (symbol, period)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    key        TEXT PRIMARY KEY,
+    summary    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS articles (
+    url           TEXT PRIMARY KEY,
+    text          TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS news (
+    link       TEXT PRIMARY KEY,
+    company    TEXT NOT NULL,
+    title      TEXT NOT NULL,
+    source     TEXT,
+    published  REAL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS news_company ON news (company, published);
+CREATE TABLE IF NOT EXISTS feeds (
+    company    TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS digest (
+    run        TEXT NOT NULL,
+    company    TEXT NOT NULL,
+    symbol     TEXT,
+    items      TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run, company)
+);
+"""
+
+
+def connect():
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _placeholders(values):
+    return ",".join("?" * len(values))
+
+
+# =================================================
+# CONVERSION
+# =================================================
+def to_long(data, symbols):
+    # yf.download frame (field x ticker columns) -> one row per symbol/date
+    if data is None or data.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        data = pd.concat({symbols[0]: data}, axis=1).swaplevel(axis=1)
+
+    frames = []
+    for symbol in data.columns.get_level_values(1).unique():
+        part = data.xs(symbol, axis=1, level=1).reindex(columns=FIELDS)
+        part = part.dropna(subset=["Close"]).rename(columns=str.lower)
+        if part.empty:
+            continue
+        part.insert(0, "date", part.index.strftime("%Y-%m-%d"))
+        part.insert(0, "symbol", symbol)
+        frames.append(part)
+
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
+
+
+# =================================================
+# READ / WRITE
+# =================================================
+def write_history(rows):
+    if rows.empty:
+        return 0
+
+    rows = rows[COLUMNS].astype(object).where(rows[COLUMNS].notna(), None)
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO ohlcv VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows.itertuples(index=False, name=None),
+        )
+    return len(rows)
+
+
+def date_spans(symbols):
+    # {symbol: (first_date, last_date)} for symbols that have stored bars
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+
+    with closing(connect()) as conn:
+        cur = conn.execute(
+            f"SELECT symbol, MIN(date), MAX(date) FROM ohlcv "
+            f"WHERE symbol IN ({_placeholders(symbols)}) GROUP BY symbol",
+            symbols,
+        )
+        return {s: (first, last) for s, first, last in cur}
+
+
+def read_closes(symbols, start=None):
+    # Wide date x symbol close matrix straight from the store
+    symbols = list(symbols)
+    if not symbols:
+        return pd.DataFrame()
+
+    sql = f"SELECT date, symbol, close FROM ohlcv WHERE symbol IN ({_placeholders(symbols)})"
+    params = list(symbols)
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+
+    with closing(connect()) as conn:
+        rows = pd.read_sql_query(sql, conn, params=params)
+
+    closes = rows.pivot(index="date", columns="symbol", values="close")
+    closes.index = pd.to_datetime(closes.index)
+    return closes.sort_index().reindex(columns=symbols)
+
+
+# =================================================
+# SYNC BOOKKEEPING
+# =================================================
+def mark_synced(symbols, when=None):
+    when = time.time() if when is None else when
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO sync VALUES (?, ?)",
+            [(s, when) for s in symbols],
+        )
+
+
+def synced_within(symbols, seconds):
+    # Symbols whose provider sync happened less than `seconds` ago
+    symbols = list(symbols)
+    if not symbols:
+        return set()
+
+    with closing(connect()) as conn:
+        cur = conn.execute(
+            f"SELECT symbol FROM sync WHERE symbol IN ({_placeholders(symbols)}) "
+            f"AND synced_at >= ?",
+            symbols + [time.time() - seconds],
+        )
+        return {s for (s,) in cur}
+
+
+def mark_backfilled(symbols, period):
+    # The provider was asked for the whole `period`; whatever it returned is
+    # all the history there is, however short
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO backfills VALUES (?, ?, ?)",
+            [(s, period, now) for s in symbols],
+        )
+
+
+def backfilled(symbols, period):
+    symbols = list(symbols)
+    if not symbols:
+        return set()
+
+    with closing(connect()) as conn:
+        cur = conn.execute(
+            f"SELECT symbol FROM backfills WHERE symbol IN ({_placeholders(symbols)}) "
+            f"AND period = ?",
+            symbols + [period],
+        )
+        return {s for (s,) in cur}
+
+
+# =================================================
+# AI SUMMARY CACHE
+# =================================================
+def get_summary(key):
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        row = conn.execute(
+            "SELECT summary FROM summaries WHERE key = ? AND created_at >= ?",
+            (key, now - SUMMARY_CACHE_DAYS * 86400),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+
+def put_summary(keys, summary):
+    # Same summary may be reachable under several keys (content and link)
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+            [(k, summary, now, now) for k in keys],
+        )
+        # Evict expired entries, then least recently used beyond the cap
+        conn.execute(
+            "DELETE FROM summaries WHERE created_at < ?",
+            (now - SUMMARY_CACHE_DAYS * 86400,),
+        )
+        conn.execute(
+            "DELETE FROM summaries WHERE key NOT IN "
+            "(SELECT key FROM summaries ORDER BY last_used DESC LIMIT ?)",
+            (SUMMARY_CACHE_MAX,),
+        )
+
+
+# =================================================
+# ARTICLE CACHE
+# =================================================
+def get_article(url):
+    # {"text", "etag", "last_modified", "fetched_at"} or None
+    with closing(connect()) as conn:
+        row = conn.execute(
+            "SELECT text, etag, last_modified, fetched_at FROM articles WHERE url = ?",
+            (url,),
+        ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(["text", "etag", "last_modified", "fetched_at"], row))
+
+
+def put_article(urls, text, etag=None, last_modified=None):
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?)",
+            [(u, text, etag, last_modified, now) for u in urls],
+        )
+        conn.execute(
+            "DELETE FROM articles WHERE fetched_at < ?",
+            (now - ARTICLE_CACHE_DAYS * 86400,),
+        )
+
+
+def touch_article(url):
+    # Revalidated with a 304: keep the body, reset its age
+    with closing(connect()) as conn, conn:
+        conn.execute("UPDATE articles SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+
+# =================================================
+# NEWS INDEX
+# =================================================
+NEWS_FIELDS = ["title", "link", "source", "published", "company"]
+
+
+def put_news(company, items):
+    # Index new items and record that the company's feed was just read
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO news VALUES (?, ?, ?, ?, ?, ?)",
+            [(i["link"], company, i["title"], i.get("source"), i.get("published"), now)
+             for i in items],
+        )
+        conn.execute(
+            "INSERT INTO feeds (company, fetched_at) VALUES (?, ?) "
+            "ON CONFLICT(company) DO UPDATE SET fetched_at = excluded.fetched_at",
+            (company, now),
+        )
+        conn.execute(
+            "DELETE FROM news WHERE fetched_at < ?", (now - NEWS_KEEP_DAYS * 86400,)
+        )
+
+
+def known_links(company):
+    with closing(connect()) as conn:
+        cur = conn.execute("SELECT link FROM news WHERE company = ?", (company,))
+        return {link for (link,) in cur}
+
+
+def company_news(company, limit, fresh_within=None):
+    # Newest items for one company; empty if the company's feed was not read
+    # within `fresh_within` seconds
+    with closing(connect()) as conn:
+        if fresh_within is not None:
+            row = conn.execute(
+                "SELECT fetched_at FROM feeds WHERE company = ?", (company,)
+            ).fetchone()
+            if row is None or row[0] < time.time() - fresh_within:
+                return []
+
+        cur = conn.execute(
+            "SELECT title, link, source, published, company FROM news "
+            "WHERE company = ? ORDER BY published DESC LIMIT ?",
+            (company, limit),
+        )
+        return [dict(zip(NEWS_FIELDS, row)) for row in cur]
+
+
+def latest_news(limit):
+    with closing(connect()) as conn:
+        cur = conn.execute(
+            "SELECT title, link, source, published, company FROM news "
+            "ORDER BY published DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(zip(NEWS_FIELDS, row)) for row in cur]
+
+
+# =================================================
+# PRECOMPUTED DIGEST
+# =================================================
+def put_digest(run, company, symbol, items):
+    # One row per company per run; written as each company finishes so an
+    # interrupted run can pick up where it stopped
+    now = time.time()
+    with closing(connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO digest VALUES (?, ?, ?, ?, ?)",
+            (run, company, symbol, json.dumps(items), now),
+        )
+        # Run ids are free text, so recency comes from when rows were written
+        conn.execute(
+            "DELETE FROM digest WHERE run NOT IN "
+            "(SELECT run FROM digest GROUP BY run ORDER BY MAX(created_at) DESC LIMIT ?)",
+            (DIGEST_KEEP_RUNS,),
+        )
+
+
+def digest_items(run):
+    # {company: items} already written for `run`
+    with closing(connect()) as conn:
+        cur = conn.execute("SELECT company, items FROM digest WHERE run = ?", (run,))
+        return {c: json.loads(items) for c, items in cur}
+
+
+def latest_digest(company):
+    # {"run", "items", "created_at"} from the newest run covering `company`
+    with closing(connect()) as conn:
+        row = conn.execute(
+            "SELECT run, items, created_at FROM digest WHERE company = ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (company,),
+        ).fetchone()
+    if row is None:
+        return None
+    return {"run": row[0], "items": json.loads(row[1]), "created_at": row[2]}
@@ -0,0 +1,472 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a word/punctuation estimate
+    tiktoken = None
+
+STUB_MODEL = "stub"
+STUB_STREAM_DELAY = float(os.getenv("STUB_STREAM_DELAY", "0.02"))   # seconds per fake token
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+
+# =================================================
+# PROMPTS
+# =================================================
+def news_prompt(company, context):
+    return f"""
+You are an equity research analyst.
+
+Company: {company}
+
+News content:
+{context}
+
+Task:
+- Explain what happened
+- Why it matters (or not)
+- Risks or positives
+- NO buy/sell advice
+- NO price prediction
+
+Limit to 5 bullet points.
+"""
+
+
+# =================================================
+# TOKEN BUDGETING
+# =================================================
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is not None:
+        try:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            return len(_encoding.encode(text))
+        except Exception:
+            pass
+    # Roughly one BPE token per word or punctuation mark in English prose
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _terms(text):
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 2]
+
+
+def split_sentences(text):
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if len(s.strip()) > 20]
+
+
+def build_context(company, headline, text, budget):
+    # Picks the sentences most relevant to the headline and company (TF-IDF
+    # weighted overlap, with a bonus for naming the company) until `budget`
+    # tokens are used, then restores article order so the excerpt reads
+    # naturally. Short texts are returned untouched.
+    if not text:
+        return headline
+    if count_tokens(text) <= budget:
+        return text
+
+    sentences = split_sentences(text)
+    if not sentences:
+        return text[: budget * 4]
+
+    docs = [Counter(_terms(s)) for s in sentences]
+    df = Counter(t for d in docs for t in d)
+    idf = {t: math.log((1 + len(docs)) / (1 + n)) + 1 for t, n in df.items()}
+
+    query = set(_terms(headline)) | set(_terms(company))
+    name = set(_terms(company))
+
+    scores = []
+    for i, doc in enumerate(docs):
+        score = sum(idf[t] * (1 + math.log(doc[t])) for t in query if t in doc)
+        if name & doc.keys():
+            score *= 1.5
+        score += 0.5 / (1 + i)  # slight preference for the lede
+        scores.append((score, i))
+
+    # Sentences sharing no terms with the query only make it in when nothing
+    # else does; they are usually page furniture or unrelated stories
+    relevant = [(sc, i) for sc, i in scores if sc > 0.5 / (1 + i)] or scores
+
+    chosen, seen, used = [], set(), 0
+    for _, i in sorted(relevant, reverse=True):
+        cost = count_tokens(sentences[i])
+        if sentences[i] in seen or used + cost > budget:
+            continue
+        chosen.append(i)
+        seen.add(sentences[i])
+        used += cost
+    if not chosen:
+        # Every sentence is over budget: cut the best one down to size
+        best = sentences[max(relevant)[1]]
+        return best[: budget * 4]
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+# =================================================
+# BATCHED SUMMARIES (ONE REQUEST PER COMPANY)
+# =================================================
+TOKENS_PER_ARTICLE = 250
+MAX_BATCH_TOKENS = 1500
+
+
+def build_batch_prompt(company, articles):
+    # articles: [(headline, context), ...]
+    sections = "\n\n".join(
+        f"### Article {i}\nHeadline: {headline}\n{context}"
+        for i, (headline, context) in enumerate(articles, 1)
+    )
+    return f"""
+You are an equity research analyst.
+
+Company: {company}
+
+{sections}
+
+Task, for EACH article separately:
+- Explain what happened
+- Why it matters (or not)
+- Risks or positives
+- NO buy/sell advice
+- NO price prediction
+
+Limit to 5 bullet points per article.
+
+Reply with a JSON object mapping the article number (as a string) to a list
+of bullet strings, e.g. {{"1": ["...", "..."], "2": ["..."]}}.
+"""
+
+
+def parse_batch_response(text, count):
+    # -> [summary or None] aligned with the articles sent
+    try:
+        data = json.loads(text)
+    except ValueError:
+        match = re.search(r"\{.*\}", text, re.S)
+        try:
+            data = json.loads(match.group(0)) if match else {}
+        except ValueError:
+            data = {}
+
+    summaries = []
+    for i in range(1, count + 1):
+        bullets = data.get(str(i)) if isinstance(data, dict) else None
+        if isinstance(bullets, str):
+            bullets = [bullets]
+        if bullets:
+            summaries.append("\n".join(f"- {str(b).lstrip('-• ').strip()}" for b in bullets))
+        else:
+            summaries.append(None)
+    return summaries
+
+
+# =================================================
+# RATE LIMITING
+# =================================================
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        with self.lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        with self.lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.level < amount:
+                return False
+            self.level -= amount
+            return True
+
+
+class RateLimiter:
+    # Requests-per-minute and tokens-per-minute buckets, checked together so
+    # a call only proceeds when both have room. Callers block (up to
+    # `max_wait`) instead of tripping the provider's own limits.
+    def __init__(self, rpm, tpm, max_wait=30):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self.lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait == 0 and self.requests.take(1) and self.tokens.take(tokens):
+                    return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f"rate limit wait would exceed {self.max_wait}s")
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(key, rpm, tpm):
+    # Shared by every backend instance that talks to the same account
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rpm, tpm)
+        return _limiters[key]
+
+
+# =================================================
+# SUMMARIZER BACKENDS
+# =================================================
+# Every backend answers the same three calls; prompt-based ones only need
+# complete() and stream(). `id` goes into summary cache keys so output from
+# different backends/models is never mixed up.
+SUMMARY_TOKENS = 250
+
+
+class Summarizer(ABC):
+    name = "base"
+    needs_key = False
+
+    def __init__(self, model=None):
+        self.model = model
+        self.id = f"{self.name}:{model}" if model else self.name
+
+    @abstractmethod
+    def summarize(self, company, headline, text, budget, usage=None):
+        ...
+
+    def summarize_stream(self, company, headline, text, budget, usage=None):
+        yield self.summarize(company, headline, text, budget, usage)
+
+    def summarize_batch(self, company, articles, budget=None, usage=None):
+        # articles: [(headline, text)]
+        return [self.summarize(company, h, t, budget, usage) for h, t in articles]
+
+
+class PromptSummarizer(Summarizer):
+    # Backends driven by an LLM prompt
+
+    # -- prompt-level primitives ---------------------------------------
+    @abstractmethod
+    def complete(self, prompt, max_tokens, json_mode=False, usage=None):
+        ...
+
+    def stream(self, prompt, max_tokens, usage=None):
+        # Backends without native streaming hand back the whole answer at once
+        yield self.complete(prompt, max_tokens, usage=usage)
+
+    # -- summaries -------------------------------------------------------
+    def summarize(self, company, headline, text, budget, usage=None):
+        prompt = news_prompt(company, build_context(company, headline, text, budget))
+        return self.complete(prompt, SUMMARY_TOKENS, usage=usage)
+
+    def summarize_stream(self, company, headline, text, budget, usage=None):
+        prompt = news_prompt(company, build_context(company, headline, text, budget))
+        return self.stream(prompt, SUMMARY_TOKENS, usage=usage)
+
+    def summarize_batch(self, company, articles, budget=None, usage=None):
+        # One request for all articles; each text is trimmed to `budget` tokens
+        if not articles:
+            return []
+        if budget:
+            articles = [(h, build_context(company, h, t, budget)) for h, t in articles]
+        text = self.complete(
+            build_batch_prompt(company, articles),
+            min(MAX_BATCH_TOKENS, TOKENS_PER_ARTICLE * len(articles)),
+            json_mode=True,
+            usage=usage,
+        )
+        return parse_batch_response(text, len(articles))
+
+
+def _record_usage(usage, prompt, text, reported=None):
+    if usage is not None:
+        usage.update({
+            "in": getattr(reported, "prompt_tokens", None) or count_tokens(prompt),
+            "out": getattr(reported, "completion_tokens", None) or count_tokens(text),
+        })
+
+
+class OpenAISummarizer(PromptSummarizer):
+    # Any OpenAI-compatible chat endpoint. The client (and its connection
+    # pool) is built once per backend instance rather than per headline.
+    name = "openai"
+    needs_key = True
+
+    def __init__(self, model, api_key=None, base_url=None, temperature=0.2, limiter=None):
+        super().__init__(model)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.temperature = temperature
+        self.limiter = limiter
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _throttle(self, prompt, max_tokens):
+        if self.limiter is not None:
+            self.limiter.acquire(count_tokens(prompt) + max_tokens)
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            return self._client
+
+    def complete(self, prompt, max_tokens, json_mode=False, usage=None):
+        self._throttle(prompt, max_tokens)
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        text = response.choices[0].message.content.strip()
+        _record_usage(usage, prompt, text, getattr(response, "usage", None))
+        return text
+
+    def stream(self, prompt, max_tokens, usage=None):
+        self._throttle(prompt, max_tokens)
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parts, reported = [], None
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+            if getattr(chunk, "usage", None):
+                reported = chunk.usage
+        _record_usage(usage, prompt, "".join(parts), reported)
+
+
+class LocalLLMSummarizer(OpenAISummarizer):
+    # llama.cpp's server (and Ollama, vLLM, ...) speak the OpenAI chat API,
+    # so a local model is the OpenAI backend pointed at localhost.
+    name = "local"
+    needs_key = False
+
+    def __init__(self, model, base_url, temperature=0.2):
+        super().__init__(model, api_key="local", base_url=base_url, temperature=temperature)
+
+
+class StubSummarizer(PromptSummarizer):
+    # Deterministic offline stand-in, used for testing the pipeline
+    name = STUB_MODEL
+
+    def complete(self, prompt, max_tokens, json_mode=False, usage=None):
+        text = stub_complete(prompt, json_mode)
+        _record_usage(usage, prompt, text)
+        return text
+
+    def stream(self, prompt, max_tokens, usage=None):
+        text = stub_complete(prompt)
+        for piece in re.findall(r"\S+\s*", text):
+            if STUB_STREAM_DELAY:
+                time.sleep(STUB_STREAM_DELAY)
+            yield piece
+        _record_usage(usage, prompt, text)
+
+
+class ExtractiveSummarizer(Summarizer):
+    # No model at all: the most relevant sentences, as bullets. Instant,
+    # free and fully offline; quality is that of the source text. No request
+    # is made, so `usage` is left untouched.
+    name = "extractive"
+    BULLETS = 4
+
+    def _bullets(self, company, headline, text, budget):
+        excerpt = build_context(company, headline, text or headline, min(budget or 120, 120))
+        sentences = split_sentences(excerpt) or [headline]
+        return "\n".join(f"- {s}" for s in sentences[: self.BULLETS])
+
+    def summarize(self, company, headline, text, budget, usage=None):
+        return self._bullets(company, headline, text, budget)
+
+
+BACKENDS = {
+    "openai": OpenAISummarizer,
+    "local": LocalLLMSummarizer,
+    "extractive": ExtractiveSummarizer,
+    STUB_MODEL: StubSummarizer,
+}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_summarizer(backend="openai", model=None, api_key=None, base_url=None):
+    # One instance per configuration for the life of the process, so clients
+    # and their connection pools are reused across headlines and reruns
+    key = (backend, model, api_key, base_url)
+    with _instances_lock:
+        if key not in _instances:
+            if backend == "openai":
+                limiter = get_limiter(("openai", api_key), OPENAI_RPM, OPENAI_TPM)
+                _instances[key] = OpenAISummarizer(model, api_key=api_key, limiter=limiter)
+            elif backend == "local":
+                _instances[key] = LocalLLMSummarizer(model, base_url)
+            elif backend in BACKENDS:
+                _instances[key] = BACKENDS[backend]()
+            else:
+                raise ValueError(f"unknown summarizer backend: {backend}")
+        return _instances[key]
+
+
+# =================================================
+# LOCAL STUB MODEL
+# =================================================
+
+def _first_sentences(text, n):
+    sentences = re.split(r"(?<=[.!?])\s+", re.sub(r"\s+", " ", text).strip())
+    return [s for s in sentences if s][:n]
+
+
+def stub_complete(prompt, json_mode=False):
+    # Deterministic stand-in: echoes the leading sentences of each article in
+    # the shape the real model is asked for.
+    articles = re.findall(r"### Article (\d+)\n(.*?)(?=\n### Article |\nTask, for EACH|\Z)", prompt, re.S)
+    if json_mode:
+        return json.dumps({
+            n: _first_sentences(re.sub(r"^Headline:.*\n?", "", body), 3) or ["(no content)"]
+            for n, body in articles
+        })
+
+    match = re.search(r"News content:\n(.*?)\nTask:", prompt, re.S)
+    body = match.group(1) if match else prompt
+    return "\n".join(f"- {s}" for s in _first_sentences(body, 3)) or "- (no content)"
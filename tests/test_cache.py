@@ -0,0 +1,167 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import cache
+
+
+def test_coalesce_shares_one_call():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "summary"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.coalesce("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.coalesce("k", slow))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    time.sleep(0.2)  # let the followers reach the in-flight call
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert calls == [1]
+    assert sorted(results) == [("summary", False)] + [("summary", True)] * 3
+
+
+def test_coalesce_propagates_errors_and_forgets_the_key():
+    def boom():
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        cache.coalesce("k", boom)
+    assert cache.coalesce("k", lambda: 1) == (1, False)
+
+
+def test_short_ttl_entries_without_max_stale_refresh_in_the_caller():
+    # Regression: transient failures (short per-result TTL) fell into the
+    # function's stale window and each spawned a background refresh,
+    # escaping the caller's bounded worker pool
+    threads = []
+
+    @cache.cached(ttl=60, ttl_for=lambda value: 0.05)
+    def fetch(symbol):
+        threads.append(threading.current_thread())
+        return symbol
+
+    fetch.clear()
+    fetch("TCS.NS")
+    time.sleep(0.1)
+    assert fetch.is_stale("TCS.NS")
+    fetch("TCS.NS")
+
+    assert threads == [threading.current_thread()] * 2
+    assert not fetch.is_stale("TCS.NS")
+
+
+_names = itertools.count()
+
+
+def counter(**kwargs):
+    # Cached function returning 1, 2, 3, ... and the threads calls ran in.
+    # Entries are keyed by qualified name, so each one gets its own.
+    calls = []
+
+    def fn(key):
+        calls.append(threading.current_thread())
+        return len(calls)
+
+    fn.__qualname__ = f"counter{next(_names)}"
+    return cache.cached(**kwargs)(fn), calls
+
+
+def test_fresh_entries_are_served_from_cache():
+    fn, calls = counter(ttl=60)
+    assert fn("a") == 1 and fn("a") == 1 and fn("b") == 2
+    assert fn.refresh("a") == 3
+    assert fn("a") == 3
+
+
+def test_stale_entries_are_served_while_revalidating():
+    fn, calls = counter(ttl=0.05, max_stale=60)
+    fn("a")
+    time.sleep(0.1)
+
+    assert fn("a") == 1  # stale value, returned at once
+    deadline = time.time() + 5
+    while fn.is_stale("a") and time.time() < deadline:
+        time.sleep(0.01)
+    assert fn("a") == 2
+    assert calls[1] is not threading.current_thread()
+
+
+def test_entries_past_max_stale_block_for_a_new_value():
+    fn, calls = counter(ttl=0.05, max_stale=0.1)
+    fn("a")
+    time.sleep(0.2)
+    assert fn("a") == 2
+    assert calls == [threading.current_thread()] * 2
+
+
+def test_ttl_for_sets_per_result_ttl():
+    fn, _ = counter(ttl=60, ttl_for=lambda value: 5 if value == 1 else 60)
+    fn("a")
+    fn("b")
+    assert fn.entry_ttl("a") == 5
+    assert fn.entry_ttl("b") == 60
+    assert fn.entry_ttl("never called") == 60
+
+
+def test_prefetcher_due_tracks_age_against_ttl():
+    cold, _ = counter(ttl=60)
+    warm, _ = counter(ttl=60)
+    nearly, _ = counter(ttl=0.1)
+    warm("a")
+    nearly("a")
+    time.sleep(0.09)
+
+    prefetcher = cache.Prefetcher([(cold, ("a",)), (warm, ("a",)), (nearly, ("a",))], ahead=0.8)
+    assert prefetcher.due() == [(cold, ("a",)), (nearly, ("a",))]
+    prefetcher.run_once()
+    assert prefetcher.due() == []
+
+
+def test_retry_retries_transient_failures_only():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TimeoutError("slow")
+        return "ok"
+
+    result = cache.retry(flaky, lambda e: cache.TRANSIENT, attempts=3, backoff=0)
+    assert result == cache.Result("ok", cache.OK, attempts=3)
+    assert result.ok
+
+    def missing():
+        raise LookupError("delisted")
+
+    result = cache.retry(missing, lambda e: cache.MISSING, attempts=3, backoff=0)
+    assert (result.kind, result.attempts, result.error) == (cache.MISSING, 1, "LookupError: delisted")
+    assert not result.ok
+
+
+def test_retry_gives_up_after_the_last_attempt():
+    def down():
+        raise ConnectionError("reset")
+
+    result = cache.retry(down, lambda e: cache.TRANSIENT, attempts=2, backoff=0)
+    assert (result.kind, result.attempts) == (cache.TRANSIENT, 2)
+
+
+def test_negative_ttl_picks_ttl_by_result_kind():
+    ttl_for = cache.negative_ttl(ok=3600, transient=120, missing=86400)
+    assert ttl_for(cache.Result(1)) == 3600
+    assert ttl_for(cache.Result(kind=cache.TRANSIENT)) == 120
+    assert ttl_for(cache.Result(kind=cache.MISSING)) == 86400
+    assert ttl_for(cache.Result(kind="unknown")) == 120
@@ -0,0 +1,24 @@
+import dedupe
+
+
+def test_cluster_news_collapses_syndicated_copies():
+    items = [
+        {"title": "Reliance Q2 profit rises 9% on retail boost - Reuters", "source": "Reuters"},
+        {"title": "HDFC Bank raises deposit rates - Mint", "source": "Mint"},
+        {"title": "Reliance Q2 profit rises 9% on retail boost - Moneycontrol", "source": "Moneycontrol"},
+    ]
+    clusters = dedupe.cluster_news(items)
+    assert [[i["source"] for i in c] for c in clusters] == [["Reuters", "Moneycontrol"], ["Mint"]]
+
+
+def test_strip_source():
+    assert dedupe.strip_source("Infosys wins a large deal - Mint", "Mint") == "Infosys wins a large deal"
+    assert dedupe.strip_source("Short - Mint") == "Short - Mint"
+
+
+def test_similarity_of_unrelated_text_is_low():
+    a = dedupe.signature(dedupe.shingles("Tata Motors sales jump in October"))
+    b = dedupe.signature(dedupe.shingles("Wipro names new chief executive"))
+    assert dedupe.similarity(a, a) == 1.0
+    assert dedupe.similarity(a, b) < 0.4
+    assert dedupe.similarity(a, None) == 0.0
@@ -0,0 +1,88 @@
+import io
+
+import pytest
+
+pytest.importorskip("requests")
+
+import news
+
+
+def test_article_extractor_prefers_the_article_body():
+    body = "Reliance Industries reported a sharp rise in quarterly profit. " * 5
+    html = f"""
+    <html><head><style>p {{ color: red }}</style><script>var x = "<p>nope</p>";</script></head>
+    <body>
+      <nav><p>Home | Markets | Companies | Latest news and updates</p></nav>
+      <p>Subscribe to our newsletter for daily market updates.</p>
+      <article><h1>Reliance profit jumps</h1><p>{body}</p></article>
+      <footer><p>Copyright 2026 Example Media Private Limited</p></footer>
+    </body></html>
+    """
+    extractor = news.ArticleExtractor()
+    for i in range(0, len(html), 64):  # fed in chunks, as when streaming
+        extractor.feed(html[i:i + 64])
+    text = extractor.text()
+
+    assert text.startswith("Reliance profit jumps")
+    assert body.strip() in text
+    for junk in ("nope", "color", "Subscribe", "Copyright", "Markets"):
+        assert junk not in text
+
+
+def test_article_extractor_falls_back_to_paragraphs_and_caps_length():
+    para = "A paragraph long enough to count as article text. " * 4
+    extractor = news.ArticleExtractor(limit=300)
+    extractor.feed(f"<div><a>Share</a></div><p>{para}</p><p>{para}</p>")
+    assert extractor.done
+    text = extractor.text()
+    assert len(text) == 300
+    assert "Share" not in text
+
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Google News</title>
+<item><title>Story one - Mint</title><link>https://example.com/1</link>
+  <pubDate>Mon, 12 Oct 2026 09:00:00 GMT</pubDate><source url="https://mint">Mint</source></item>
+<item><title>Story two - Reuters</title><link>https://example.com/2</link>
+  <pubDate>not a date</pubDate></item>
+<item><title>Story three</title><link>https://example.com/3</link></item>
+<item><link>https://example.com/untitled</link></item>
+</channel></rss>
+"""
+
+
+def test_iter_news_feed_parses_items():
+    items = list(news.iter_news_feed(io.BytesIO(FEED)))
+    assert [i["link"] for i in items] == ["https://example.com/1", "https://example.com/2", "https://example.com/3"]
+    assert items[0]["source"] == "Mint"
+    assert items[0]["published"] == 1791795600.0
+    assert items[1]["published"] is None
+
+
+def test_iter_news_feed_limit_counts_known_links():
+    # Known links are skipped but still count towards the limit, so a
+    # relevance-ordered feed with an unchanged top item still yields new ones
+    items = list(news.iter_news_feed(io.BytesIO(FEED), limit=2, known={"https://example.com/1"}))
+    assert [i["link"] for i in items] == ["https://example.com/2"]
+
+
+class BrokenStream(news.summarizer.StubSummarizer):
+    def stream(self, prompt, max_tokens, usage=None):
+        yield "- First bullet is"
+        raise ConnectionError("stream reset")
+
+
+def test_interrupted_stream_is_shown_but_not_cached(monkeypatch):
+    saved = []
+    monkeypatch.setattr(news, "ai", BrokenStream())
+    monkeypatch.setattr(news, "prepare_news_summary", lambda company, item: {
+        "item": item, "summary": None, "article_text": None, "context": item["title"], "keys": ["c", "l"],
+    })
+    monkeypatch.setattr(news.store, "put_summary", lambda keys, summary: saved.append(summary))
+
+    emitted = []
+    job = news.stream_news_item("TCS", {"title": "TCS results", "link": "https://example.com/t"}, emitted.append)
+
+    assert emitted == ["- First bullet is"]
+    assert job["summary"] == "- First bullet is" and job["incomplete"]
+    assert saved == []
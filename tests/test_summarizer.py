@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+import summarizer
+
+
+def test_get_summarizer_builds_default_backend():
+    # Regression: the openai backend used to deadlock taking the instance
+    # lock twice (get_summarizer -> get_limiter)
+    result = {}
+    t = threading.Thread(
+        target=lambda: result.setdefault("ai", summarizer.get_summarizer("openai", model="m", api_key="x")),
+        daemon=True,
+    )
+    t.start()
+    t.join(5)
+    assert not t.is_alive(), "get_summarizer('openai') hung"
+
+    ai = result["ai"]
+    assert isinstance(ai, summarizer.OpenAISummarizer)
+    assert ai.limiter is summarizer.get_limiter(("openai", "x"), summarizer.OPENAI_RPM, summarizer.OPENAI_TPM)
+    assert summarizer.get_summarizer("openai", model="m", api_key="x") is ai
+
+
+def test_batch_round_trip_with_stub():
+    ai = summarizer.StubSummarizer()
+    usage = {}
+    summaries = ai.summarize_batch(
+        "Infosys",
+        [
+            ("Infosys wins deal", "Infosys signed a large cloud contract. It runs for five years."),
+            ("Infosys CFO quits", "The chief financial officer resigned on Monday."),
+        ],
+        usage=usage,
+    )
+    assert summaries == [
+        "- Infosys signed a large cloud contract.\n- It runs for five years.",
+        "- The chief financial officer resigned on Monday.",
+    ]
+    assert usage["in"] > 0 and usage["out"] > 0
+
+
+def test_parse_batch_response_aligns_and_tolerates_noise():
+    text = 'Sure! {"2": "only one", "1": ["- a", "• b"], "9": ["extra"]} hope this helps'
+    assert summarizer.parse_batch_response(text, 3) == ["- a\n- b", "- only one", None]
+    assert summarizer.parse_batch_response("not json", 2) == [None, None]
+
+
+def test_batch_of_nothing_makes_no_request():
+    assert summarizer.StubSummarizer().summarize_batch("Infosys", []) == []
+
+
+def test_stream_accumulates_to_the_complete_answer(monkeypatch):
+    monkeypatch.setattr(summarizer, "STUB_STREAM_DELAY", 0)
+    ai = summarizer.StubSummarizer()
+    args = ("TCS", "TCS results", "TCS beat estimates. Margins improved. Hiring slowed. Guidance held.", 200)
+
+    usage = {}
+    pieces = list(ai.summarize_stream(*args, usage=usage))
+    assert len(pieces) > 1
+    assert "".join(pieces) == ai.summarize(*args)
+    assert usage["out"] > 0
+
+
+def test_extractive_backend_reports_no_usage():
+    usage = {}
+    ai = summarizer.get_summarizer("extractive")
+    summary = ai.summarize("TCS", "TCS results", "TCS beat estimates this quarter.", 100, usage=usage)
+    assert summary.startswith("- ")
+    assert list(ai.summarize_stream("TCS", "TCS results", None, 100)) == ["- TCS results"]
+    assert usage == {}
+
+
+def test_rate_limiter_blocks_until_the_bucket_refills():
+    limiter = summarizer.RateLimiter(rpm=60, tpm=10_000, max_wait=5)
+    limiter.requests.level = 0
+    started = time.monotonic()
+    limiter.acquire(10)
+    assert time.monotonic() - started >= 0.9
+
+
+def test_rate_limiter_gives_up_past_max_wait():
+    limiter = summarizer.RateLimiter(rpm=60, tpm=60, max_wait=0.1)
+    limiter.acquire(60)
+    with pytest.raises(summarizer.RateLimited):
+        limiter.acquire(60)
+
+
+def test_build_context_keeps_relevant_sentences_within_budget():
+    text = " ".join([
+        "Markets were broadly flat in early trade on Tuesday morning.",
+        "Bharti Airtel raised mobile tariffs by fifteen percent across plans.",
+        "Cricket fans gathered outside the stadium ahead of the final match.",
+        "Analysts expect the Airtel tariff hike to lift average revenue per user.",
+    ] * 3)
+    context = summarizer.build_context("Bharti Airtel", "Airtel hikes tariffs", text, 40)
+
+    assert summarizer.count_tokens(context) <= 40
+    assert "tariffs by fifteen percent" in context
+    assert "Cricket" not in context
+    # repeated sentences are only picked once
+    assert context.count("Bharti Airtel raised") == 1
+
+
+def test_build_context_passes_short_text_through():
+    assert summarizer.build_context("TCS", "h", "Short text.", 100) == "Short text."
+    assert summarizer.build_context("TCS", "Headline only", None, 100) == "Headline only"
+
+
+def test_build_context_never_returns_empty():
+    # One run-on sentence bigger than the whole budget
+    text = "Bharti Airtel " + "raised tariffs across prepaid and postpaid plans " * 30 + "today."
+    context = summarizer.build_context("Bharti Airtel", "Airtel hikes tariffs", text, 20)
+    assert context.startswith("Bharti Airtel raised tariffs")
+    assert len(context) <= 80